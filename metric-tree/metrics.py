@@ -1,11 +1,28 @@
+import numpy as np
 import polars as pl
+from .utils.anomalies import robust_scores
+from .utils.dtypes import compact_dtypes
 from .utils.plotter import Plotter
 
 class Metric:
-    def __init__(self, name:str, data: pl.DataFrame, agg_func:str)->None:
+    def __init__(self, name:str, data: pl.DataFrame, agg_func:str, compact:bool=False, period_index:bool=False)->None:
+        """A metric in the metric tree which holds the user level data.
+
+        Args:
+            name (str): The name of the metric.
+            data (pl.DataFrame): The user level data with the columns user_id, period and value.
+            agg_func (str): The function used to aggregate the users per period. Either sum, mean or median.
+            compact (bool, optional): Whether to cast the data to the smallest dtypes which can hold it. 
+                The memory before and after is stored in memory_report. Defaults to False.
+            period_index (bool, optional): Whether compacting replaces the period with its index, i.e. 0 for the first period. 
+                The index is per metric, so only use it for metrics with the same periods. Defaults to False.
+        """
         self.name = self.__validate_name(name)
         self.data = self.__validate_data_input(data)
         self.agg_func = self.__validate_agg_func(agg_func)
+        self.memory_report = None
+        if compact:
+            self.data, self.memory_report = compact_dtypes(self.data, period_index=period_index)
 
     def __validate_name(self, name):
         if name is None:
@@ -39,6 +56,9 @@ class Metric:
         # drop the user id column, but keep all others.
         data = data.drop("user_id")
         value_col = "value"
+        if data.schema[value_col] == pl.Float32:
+            # Compacted values are aggregated with full precision
+            data = data.with_columns(pl.col(value_col).cast(pl.Float64))
         grouping_cols = [col for col in data.columns if col!=value_col]
         if self.agg_func == "sum":
             data = data.groupby(grouping_cols).agg(pl.sum(value_col))
@@ -51,6 +71,28 @@ class Metric:
         
         return data
 
+    def detect_anomalies(self, window:int=52, threshold:float=3.5, season_length:int=1, n_seasons:int=3) -> pl.DataFrame:
+        """Flagging the periods where the metric breaks its trend. See utils.anomalies.robust_scores for how the score is computed.
+
+        Args:
+            window (int, optional): The number of previous periods (or seasons) used for the baseline. Defaults to 52.
+            threshold (float, optional): The absolute score above which a period is anomalous. Defaults to 3.5.
+            season_length (int, optional): The number of periods in a season, e.g. 52 for yearly seasonality in weekly data. Defaults to 1.
+                The seasonal baseline needs about 2.5 seasons of history before the first period can be scored.
+            n_seasons (int, optional): The number of previous seasons used for the seasonal baseline. Defaults to 3.
+
+        Returns:
+            pl.DataFrame: The aggregated data sorted by period with the extra columns baseline, score and is_anomaly.
+        """
+        data = self._agg_data(self.data).sort(by="period")
+        baseline, _, score = robust_scores(data["value"].to_numpy(), window=window, season_length=season_length, n_seasons=n_seasons)
+        data = data.with_columns(
+            pl.Series(name="baseline", values=baseline[:, 0]),
+            pl.Series(name="score", values=score[:, 0]),
+            pl.Series(name="is_anomaly", values=np.abs(score[:, 0]) > threshold),
+        )
+        return data
+
     def plot_development(self):
         p = Plotter()
         plot_data = self._agg_data(self.data)
@@ -1,4 +1,5 @@
 import unittest
+import numpy as np
 import polars as pl
 
 # Assuming Metric class is defined in metric.py
@@ -123,6 +124,64 @@ class TestMetric(unittest.TestCase):
 
         assert_dataframes_equal(output, expected_output)
 
+    def test_compact_data(self):
+        data = pl.DataFrame({
+            "user_id": [1, 2, 1, 2],
+            "period": ["2022-01", "2022-01", "2022-02", "2022-02"],
+            "value": [100.0, 200.0, 300.0, 400.0],
+        })
+        metric = Metric(name="test_metric", data=data, agg_func="sum", compact=True)
+
+        self.assertEqual(metric.data.schema["user_id"], pl.UInt8)
+        self.assertEqual(metric.data.schema["value"], pl.Float32)
+        self.assertLess(metric.memory_report["after"], metric.memory_report["before"])
+
+    def test_detect_anomalies(self):
+        values = [100, 102, 98, 101, 99, 100, 103, 97, 100, 150]
+        data = pl.DataFrame({
+            "user_id": [1] * len(values),
+            "period": list(range(len(values))),
+            "value": values,
+        })
+        metric = Metric(name="test_metric", data=data, agg_func="sum")
+
+        output = metric.detect_anomalies(window=8)
+        self.assertListEqual(output["is_anomaly"].to_list(), [False] * 9 + [True])
+        self.assertEqual(output["baseline"][-1], 100)
+
+    def test_compact_data_period_index(self):
+        data = pl.DataFrame({
+            "user_id": [1, 2, 1, 2],
+            "period": ["2022-01", "2022-01", "2022-02", "2022-02"],
+            "value": [100.0, 200.0, 300.0, 400.0],
+        })
+        metric = Metric(name="test_metric", data=data, agg_func="sum", compact=True, period_index=True)
+
+        self.assertListEqual(metric.data["period"].to_list(), [0, 0, 1, 1])
+
+    def test_compact_data_sum_does_not_overflow(self):
+        data = pl.DataFrame({
+            "user_id": [1, 2, 3],
+            "period": ["2022-01", "2022-01", "2022-01"],
+            "value": [3_000_000_000, 3_000_000_000, 3_000_000_000],
+        })
+        metric = Metric(name="test_metric", data=data, agg_func="sum", compact=True)
+
+        self.assertEqual(metric._agg_data(metric.data)["value"][0], 9_000_000_000)
+
+    def test_compact_data_sum_precision(self):
+        values = np.random.default_rng(0).uniform(0, 100, size=1_000_000)
+        data = pl.DataFrame({
+            "user_id": np.arange(len(values)),
+            "period": ["2022-01"] * len(values),
+            "value": values,
+        })
+        metric = Metric(name="test_metric", data=data, agg_func="sum", compact=True)
+
+        self.assertEqual(metric.data.schema["value"], pl.Float32)
+        output = metric._agg_data(metric.data)["value"][0]
+        self.assertLess(abs(output / values.sum() - 1), 1e-6)
+
 # If this script is run directly, run the tests
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,246 @@
+import unittest
+from datetime import datetime
+import numpy as np
+import polars as pl
+import plotly.graph_objects as go
+
+from ..metrics import Metric
+from ..tree import Tree
+
+
+def create_metric(name, values):
+    data = pl.DataFrame({
+        "user_id": [1, 2] * len(values),
+        "period": [p for p in range(len(values)) for _ in range(2)],
+        "value": [v/2 for v in values for _ in range(2)],
+    })
+    return Metric(name=name, data=data, agg_func="sum")
+
+
+class TestTree(unittest.TestCase):
+    def setUp(self):
+        self.revenue = create_metric("revenue", [100, 120, 150])
+        self.orders = create_metric("orders", [10, 12, 10])
+        self.basket = create_metric("basket", [10, 10, 15])
+        self.tree = Tree()
+        self.tree.add_relationship(self.revenue, self.orders)
+        self.tree.add_relationship(self.revenue, self.basket)
+
+    def test_add_relationship(self):
+        self.assertDictEqual(self.tree.relationships, {"revenue": {"orders": 1, "basket": 1}})
+        self.assertListEqual(list(self.tree.metrics), ["revenue", "orders", "basket"])
+
+    def test_join_datasets(self):
+        output = self.tree._join_datasets()
+        self.assertListEqual(output.columns, ["period", "revenue", "orders", "basket"])
+        self.assertListEqual(output["revenue"].to_list(), [100, 120, 150])
+
+    def test_join_datasets_compacted_metrics(self):
+        periods = [datetime(2024, 1, 1), datetime(2024, 1, 8)]
+        data = pl.DataFrame({"user_id": [1, 1], "period": periods, "value": [1.0, 2.0]})
+        tree = Tree()
+        tree.add_relationship(
+            Metric(name="parent", data=data, agg_func="sum", compact=True),
+            Metric(name="child", data=data, agg_func="sum"),
+        )
+        self.assertEqual(tree.metrics["parent"].data.schema["period"], pl.Date)
+
+        output = tree._join_datasets()
+        self.assertEqual(len(output), 2)
+        self.assertListEqual(output["parent"].to_list(), output["child"].to_list())
+
+    def test_join_datasets_compacted_integer_periods(self):
+        short = pl.DataFrame({"user_id": [1, 1], "period": [0, 1], "value": [1, 2]})
+        long = pl.DataFrame({"user_id": [1, 1, 1], "period": [0, 1, 1000], "value": [1, 2, 3]})
+        tree = Tree()
+        tree.add_relationship(
+            Metric(name="parent", data=long, agg_func="sum", compact=True),
+            Metric(name="child", data=short, agg_func="sum", compact=True),
+        )
+
+        output = tree._join_datasets()
+        self.assertListEqual(output["period"].to_list(), [0, 1, 1000])
+        self.assertListEqual(output["child"].to_list(), [1, 2, None])
+
+    def test_layout_centers_parent(self):
+        positions = self.tree._layout()
+        self.assertEqual(positions["revenue"], (0.5, 0))
+        self.assertEqual(positions["orders"], (0, -1))
+        self.assertEqual(positions["basket"], (1, -1))
+
+    def test_layout_deep_tree(self):
+        tree = Tree()
+        metrics = [create_metric(f"m{i}", [1, 2]) for i in range(1200)]
+        for parent, child in zip(metrics[:-1], metrics[1:]):
+            tree.add_relationship(parent, child)
+
+        positions = tree._layout()
+        self.assertEqual(len(positions), 1200)
+        self.assertEqual(positions["m1199"], (0, -1199))
+
+    def test_plot_tree_batched_traces(self):
+        fig = self.tree.plot_tree()
+        self.assertIsInstance(fig, go.Figure)
+        # edges, sparklines and nodes
+        self.assertEqual(len(fig.data), 3)
+        self.assertEqual(len(fig.data[-1].x), 3)
+
+    def test_decompose_change_invalid_method(self):
+        with self.assertRaises(ValueError):
+            self.tree.decompose_change(method="my_custom_method")
+
+    def test_decompose_change_additive(self):
+        total = create_metric("total", [20, 22, 25])
+        a = create_metric("a", [10, 14, 14])
+        b = create_metric("b", [10, 8, 11])
+        tree = Tree()
+        tree.add_relationship(total, a)
+        tree.add_relationship(total, b)
+
+        output = tree.decompose_change(method="additive")
+        self.assertListEqual(output["child"].to_list(), ["a", "b", "a", "b"])
+        self.assertListEqual(output["contribution"].to_list(), [4, -2, 0, 3])
+        self.assertListEqual(output["period"].to_list(), [1, 1, 2, 2])
+        self.assertListEqual(output["previous_period"].to_list(), [0, 0, 1, 1])
+
+    def test_decompose_change_multiplicative_sums_to_parent_change(self):
+        for method in ["multiplicative", "shapley"]:
+            output = self.tree.decompose_change(method=method)
+            totals = output.groupby("period").agg(pl.sum("contribution"), pl.first("parent_change")).sort(by="period")
+            for contribution, change in zip(totals["contribution"], totals["parent_change"]):
+                self.assertAlmostEqual(contribution, change)
+
+    def test_decompose_change_shapley(self):
+        output = self.tree.decompose_change(method="shapley").filter(pl.col("period")==1)
+        # orders: 2 * (10 + 10) / 2, basket: 0 * (10 + 12) / 2
+        self.assertListEqual(output["contribution"].to_list(), [20, 0])
+
+    def test_decompose_change_shapley_blocks(self):
+        expected = self.tree.decompose_change(method="shapley")
+        # Forcing one parent and one subset per block
+        self.tree._shapley_block_values = 1
+        output = self.tree.decompose_change(method="shapley")
+        self.assertListEqual(output["contribution"].to_list(), expected["contribution"].to_list())
+
+    def test_decompose_change_shapley_too_many_children(self):
+        tree = Tree()
+        parent = create_metric("parent", [1, 2])
+        for i in range(Tree._max_shapley_children + 1):
+            tree.add_relationship(parent, create_metric(f"child_{i}", [1, 2]))
+
+        with self.assertRaises(ValueError):
+            tree.decompose_change(method="shapley")
+        # The multiplicative method has no limit
+        tree.decompose_change(method="multiplicative")
+
+    def test_decompose_change_ratio(self):
+        clicks = create_metric("clicks", [10, 20, 30])
+        views = create_metric("views", [100, 100, 200])
+        ctr = create_metric("ctr", [0.1, 0.2, 0.15])
+        tree = Tree()
+        tree.add_relationship(ctr, clicks)
+        tree.add_relationship(ctr, views, weight=-1)
+
+        output = tree.decompose_change(method="multiplicative").filter(pl.col("period")==1)
+        self.assertAlmostEqual(output["contribution"][0], 0.1)
+        self.assertAlmostEqual(output["contribution"][1], 0)
+
+    def test_decompose_change_multiplicative_non_positive(self):
+        parent = create_metric("parent", [0, 10])
+        child = create_metric("child", [0, 2])
+        other = create_metric("other", [5, 5])
+        tree = Tree()
+        tree.add_relationship(parent, child)
+        tree.add_relationship(parent, other)
+
+        output = tree.decompose_change(method="multiplicative")
+        self.assertTrue(output["contribution"].is_nan().any())
+        output = tree.decompose_change(method="shapley")
+        self.assertListEqual(output["contribution"].to_list(), [10, 0])
+
+    def test_decompose_change_mix_rate_weights(self):
+        tree = Tree()
+        tree.add_relationship(self.revenue, self.orders, weight=2)
+        with self.assertRaises(ValueError):
+            tree.decompose_change(method="mix_rate")
+
+    def test_decompose_change_mix_rate(self):
+        rate = Metric(name="rate", agg_func="mean", data=pl.DataFrame({
+            "user_id": [1, 2, 3, 1, 2, 3],
+            "period": [0, 0, 0, 1, 1, 1],
+            "value": [1.0, 0.0, 0.0, 1.0, 1.0, 0.0],
+        }))
+        segment_a = Metric(name="segment_a", agg_func="mean", data=pl.DataFrame({
+            "user_id": [1, 1, 2],
+            "period": [0, 1, 1],
+            "value": [1.0, 1.0, 1.0],
+        }))
+        segment_b = Metric(name="segment_b", agg_func="mean", data=pl.DataFrame({
+            "user_id": [2, 3, 3],
+            "period": [0, 0, 1],
+            "value": [0.0, 0.0, 0.0],
+        }))
+        tree = Tree()
+        tree.add_relationship(rate, segment_a)
+        tree.add_relationship(rate, segment_b)
+
+        output = tree.decompose_change(method="mix_rate", parent_metric_name="rate")
+        # The rates are unchanged, so the whole change comes from user 2 moving to segment a
+        self.assertListEqual(output["rate_effect"].to_list(), [0, 0])
+        self.assertAlmostEqual(output["contribution"].sum(), output["parent_change"][0])
+        self.assertAlmostEqual(output["mix_effect"][0], 1/3)
+
+    def test_detect_anomalies_root_cause(self):
+        n_periods = 12
+        noise = [0.3, -0.2, 0.5, -0.4, 0.1, -0.1, 0.2, -0.3, 0.4, -0.5, 0.0, 0.2]
+        orders_values = [10 + n for n in noise]
+        basket_values = [10 - n for n in noise[::-1]]
+        # A break in the basket size in the last period
+        basket_values[-1] = 30
+        orders = create_metric("orders", orders_values)
+        basket = create_metric("basket", basket_values)
+        revenue = create_metric("revenue", [o*b for o, b in zip(orders_values, basket_values)])
+        tree = Tree()
+        tree.add_relationship(revenue, orders)
+        tree.add_relationship(revenue, basket)
+
+        output = tree.detect_anomalies(window=8).sort(by="metric")
+        self.assertListEqual(output["metric"].to_list(), ["basket", "revenue"])
+        self.assertListEqual(output["period"].to_list(), [n_periods-1, n_periods-1])
+        self.assertListEqual(output["root_cause"].to_list(), ["basket", "basket"])
+
+    def test_detect_anomalies_deep_tree(self):
+        tree = Tree()
+        metrics = [create_metric(f"m{i}", list(range(1, 20))) for i in range(1200)]
+        for parent, child in zip(metrics[:-1], metrics[1:]):
+            tree.add_relationship(parent, child)
+
+        output = tree.detect_anomalies(window=8)
+        self.assertEqual(len(output), 0)
+
+    def test_detect_anomalies_without_history(self):
+        with self.assertWarns(UserWarning):
+            output = self.tree.detect_anomalies(window=8)
+        self.assertEqual(len(output), 0)
+
+    def test_detect_anomalies_seasonal(self):
+        # Four years of weekly data with yearly seasonality and a spike in the last week of the basket size
+        weeks = np.arange(4*52)
+        noise = np.random.default_rng(0).normal(0, 0.2, size=(2, len(weeks)))
+        orders_values = 10 + 3*np.sin(2*np.pi*weeks/52) + noise[0]
+        basket_values = 10 + 0.01*weeks + noise[1]
+        basket_values[-1] += 5
+        orders = create_metric("orders", list(orders_values))
+        basket = create_metric("basket", list(basket_values))
+        revenue = create_metric("revenue", list(orders_values*basket_values))
+        tree = Tree()
+        tree.add_relationship(revenue, orders)
+        tree.add_relationship(revenue, basket)
+
+        output = tree.detect_anomalies(season_length=52).filter(pl.col("period")==len(weeks)-1).sort(by="metric")
+        self.assertListEqual(output["metric"].to_list(), ["basket", "revenue"])
+        self.assertListEqual(output["root_cause"].to_list(), ["basket", "basket"])
+
+# If this script is run directly, run the tests
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+from ...utils.anomalies import robust_scores
+
+import numpy as np
+import unittest
+
+
+class TestRobustScores(unittest.TestCase):
+    def test_robust_scores_shape(self):
+        values = np.random.default_rng(0).normal(size=(20, 3))
+        baseline, scale, score = robust_scores(values, window=4)
+        self.assertEqual(baseline.shape, (20, 3))
+        self.assertEqual(scale.shape, (20, 3))
+        self.assertEqual(score.shape, (20, 3))
+
+    def test_robust_scores_min_periods(self):
+        values = np.arange(10, dtype=float)
+        _, _, score = robust_scores(values, window=4, min_periods=2)
+        self.assertTrue(np.isnan(score[:2, 0]).all())
+        self.assertFalse(np.isnan(score[2:, 0]).any())
+
+    def test_robust_scores_values(self):
+        values = np.array([1, 2, 3, 10], dtype=float)
+        baseline, scale, score = robust_scores(values, window=3, min_periods=3)
+        self.assertEqual(baseline[-1, 0], 2)
+        self.assertAlmostEqual(scale[-1, 0], 1.4826)
+        self.assertAlmostEqual(score[-1, 0], 8 / 1.4826)
+
+    def test_robust_scores_flat_history(self):
+        values = np.array([5, 5, 5, 5, 6], dtype=float)
+        _, scale, score = robust_scores(values, window=4)
+        self.assertEqual(score[-2, 0], 0)
+        self.assertAlmostEqual(scale[-1, 0], 5e-3)
+        self.assertAlmostEqual(score[-1, 0], 200)
+
+    def test_robust_scores_zero_mad(self):
+        values = np.array([3, 3, 3, 3, 0, 4], dtype=float)
+        _, scale, _ = robust_scores(values, window=5)
+        # MAD of [3, 3, 3, 3, 0] is zero, so the mean absolute deviation is used
+        self.assertAlmostEqual(scale[-1, 0], 1.2533 * 3 / 5)
+
+    def test_robust_scores_false_positive_rate(self):
+        rng = np.random.default_rng(0)
+        for values in [rng.normal(100, 5, size=(520, 200)), rng.poisson(3, size=(520, 200))]:
+            _, _, score = robust_scores(values)
+            score = score[~np.isnan(score)]
+            self.assertTrue(np.isfinite(score).all())
+            self.assertLess(np.mean(np.abs(score) > 3.5), 0.01)
+
+    def test_robust_scores_seasonal(self):
+        # A season of 2 where every second period is high
+        values = np.tile([1.0, 10.0], 12)
+        _, _, score = robust_scores(values, window=4, season_length=2)
+        self.assertFalse(np.isnan(score).all())
+        self.assertTrue((score[~np.isnan(score)] == 0).all())
+
+    def test_robust_scores_seasonal_weekly_spike(self):
+        # Five years of weekly data with a trend, yearly seasonality and a spike in the last week
+        rng = np.random.default_rng(0)
+        weeks = np.arange(5*52)[:, None]
+        values = 100 + 0.1*weeks + 20*np.sin(2*np.pi*weeks/52) + rng.normal(0, 1, size=(len(weeks), 50))
+        values[-1, 0] += 50
+
+        _, _, score = robust_scores(values, season_length=52)
+        self.assertGreater(score[-1, 0], 3.5)
+        scored = ~np.isnan(score)
+        scored[-1, 0] = False
+        self.assertLess(np.mean(np.abs(score[scored]) > 3.5), 0.01)
+
+    def test_robust_scores_warns_without_history(self):
+        values = np.random.default_rng(0).normal(size=(2*52, 3))
+        with self.assertWarns(UserWarning):
+            _, _, score = robust_scores(values, season_length=52)
+        self.assertTrue(np.isnan(score).all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+from ...utils.dtypes import compact_dtypes
+
+from datetime import datetime
+import polars as pl
+import unittest
+
+
+class TestCompactDtypes(unittest.TestCase):
+    def setUp(self):
+        self.df = pl.DataFrame({
+            'user_id': [1, 2, 1, 2],
+            'period': [datetime(2024, 1, 1), datetime(2024, 1, 1), datetime(2024, 1, 8), datetime(2024, 1, 8)],
+            'value': [10.5, 20.25, 30.0, 40.125],
+            'variant': ['control', 'variant', 'control', 'variant']
+        })
+
+    def test_compact_dtypes_schema(self):
+        df, _ = compact_dtypes(self.df)
+        self.assertEqual(df.schema["user_id"], pl.UInt8)
+        self.assertEqual(df.schema["period"], pl.Date)
+        self.assertEqual(df.schema["value"], pl.Float32)
+        self.assertEqual(df.schema["variant"], pl.Categorical)
+
+    def test_compact_dtypes_memory_report(self):
+        _, report = compact_dtypes(self.df)
+        self.assertEqual(report["before"], self.df.estimated_size())
+        self.assertLess(report["after"], report["before"])
+
+    def test_compact_dtypes_keeps_precise_floats(self):
+        # Too large for Float32
+        df = self.df.with_columns(pl.col("value") * 1e40)
+        df, _ = compact_dtypes(df)
+        self.assertEqual(df.schema["value"], pl.Float64)
+
+        # Too precise for Float32 with the given tolerance
+        df = self.df.with_columns(pl.col("value") + 0.1)
+        df, _ = compact_dtypes(df, rtol=1e-12)
+        self.assertEqual(df.schema["value"], pl.Float64)
+
+    def test_compact_dtypes_keeps_datetimes_with_time(self):
+        df = self.df.with_columns(pl.col("period").dt.offset_by("1h"))
+        df, _ = compact_dtypes(df)
+        self.assertEqual(df.schema["period"], pl.Datetime("us"))
+
+    def test_compact_dtypes_period_index(self):
+        df, _ = compact_dtypes(self.df, period_index=True)
+        self.assertListEqual(df["period"].to_list(), [0, 0, 1, 1])
+        self.assertEqual(df.schema["period"], pl.UInt8)
+
+    def test_compact_dtypes_keeps_integer_values(self):
+        df, _ = compact_dtypes(pl.DataFrame({'user_id': [1, 2], 'value': [1, 2]}))
+        self.assertEqual(df.schema["user_id"], pl.UInt8)
+        self.assertEqual(df.schema["value"], pl.Int64)
+
+    def test_compact_dtypes_signed_integers(self):
+        df, _ = compact_dtypes(pl.DataFrame({'user_id': [-1, 1000]}))
+        self.assertEqual(df.schema["user_id"], pl.Int16)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,6 @@
 from ...utils.plotter import Plotter
 
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
@@ -70,5 +71,45 @@ class TestLinePlot(unittest.TestCase):
         # Check if the _set_end_label method was called for each data point
         self.assertEqual(self.instance._set_end_label.call_count, len(self.df1["color"].unique()))
 
+class TestTreePlot(unittest.TestCase):
+    def setUp(self):
+        self.instance = Plotter()
+        self.nodes = pd.DataFrame({
+            'name': ['a', 'b', 'c'],
+            'x': [0.5, 0, 1],
+            'y': [0, -1, -1]
+        })
+        self.edges = [('a', 'b'), ('a', 'c')]
+        self.values = np.array([[10, 20], [5, 8], [5, 12]])
+
+    def test_tree_plot_traces(self):
+        fig = self.instance.tree_plot(self.nodes, self.edges, self.values)
+        self.assertIsInstance(fig, go.Figure)
+        self.assertEqual(len(fig.data), 3)
+
+    def test_tree_plot_without_sparklines(self):
+        fig = self.instance.tree_plot(self.nodes, self.edges, self.values, sparklines=False)
+        self.assertEqual(len(fig.data), 2)
+
+    def test_tree_plot_size_grows_with_leaves(self):
+        small = self.instance.tree_plot(self.nodes, self.edges, self.values)
+        self.assertEqual(small.layout.width, 800)
+        self.assertEqual(small.layout.height, 500)
+
+        n_leaves = 50
+        nodes = pd.DataFrame({
+            'name': ['root'] + [f'leaf_{i}' for i in range(n_leaves)],
+            'x': [(n_leaves-1) / 2] + list(range(n_leaves)),
+            'y': [0] + [-1] * n_leaves
+        })
+        edges = [('root', f'leaf_{i}') for i in range(n_leaves)]
+        values = np.ones((n_leaves + 1, 2))
+        large = self.instance.tree_plot(nodes, edges, values, px_per_leaf=100)
+        self.assertGreaterEqual(large.layout.width, n_leaves*100)
+
+    def test_tree_plot_labels(self):
+        fig = self.instance.tree_plot(self.nodes, self.edges, self.values)
+        self.assertEqual(fig.data[-1].text[0], "a<br>20.0 (+100.0%)")
+
 if __name__ == '__main__':
     unittest.main()
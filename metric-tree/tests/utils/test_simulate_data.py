@@ -0,0 +1,65 @@
+from ...utils.simulate_data import SimulateData
+
+import numpy as np
+import polars as pl
+import unittest
+
+
+class TestSimulateData(unittest.TestCase):
+    def test_create_dataset_shape(self):
+        s = SimulateData(n_metrics=3, n_periods=5, n_users=10)
+        self.assertEqual(s.data.shape, (50, 5))
+        self.assertIsNone(s.memory_report)
+
+    def test_create_dataset_compact(self):
+        s = SimulateData(n_metrics=3, n_periods=5, n_users=10, compact=True)
+        self.assertEqual(s.data.schema["metric_0"], pl.Float32)
+        self.assertEqual(s.data.schema["user_id"], pl.UInt8)
+        self.assertEqual(s.data.schema["period"], pl.Date)
+        self.assertLess(s.memory_report["after"], s.memory_report["before"])
+
+    def test_create_dataset_period_index(self):
+        s = SimulateData(n_metrics=3, n_periods=5, n_users=10, compact=True, period_index=True)
+        self.assertEqual(s.data.schema["period"], pl.UInt8)
+        self.assertListEqual(s.data["period"].unique().sort().to_list(), [0, 1, 2, 3, 4])
+
+        # The experiment start date is mapped to the period index
+        before = s.data.filter(pl.col("period") < 3)
+        s.add_experiment("Test1", s.periods[3], experiment_groups={"control": [1, 2, 3, 4, 5], "variant": [6, 7, 8, 9, 10]})
+        self.assertTrue(s.data.filter(pl.col("period") < 3).frame_equal(before))
+        self.assertEqual(len(s.data), 50)
+
+    def test_same_seed_same_data(self):
+        s1 = SimulateData(n_metrics=3, n_periods=5, n_users=10, seed=1)
+        s2 = SimulateData(n_metrics=3, n_periods=5, n_users=10, seed=1)
+        self.assertTrue(s1.data.frame_equal(s2.data))
+
+    def test_different_seed_different_data(self):
+        s1 = SimulateData(n_metrics=3, n_periods=5, n_users=10, seed=1)
+        s2 = SimulateData(n_metrics=3, n_periods=5, n_users=10, seed=2)
+        self.assertFalse(s1.data.frame_equal(s2.data))
+
+    def test_generator_seed(self):
+        s1 = SimulateData(n_metrics=3, n_periods=5, n_users=10, seed=np.random.default_rng(1))
+        s2 = SimulateData(n_metrics=3, n_periods=5, n_users=10, seed=np.random.default_rng(1))
+        self.assertTrue(s1.data.frame_equal(s2.data))
+
+        # Reusing the same seed sequence gives the same data
+        seed_sequence = np.random.SeedSequence(1)
+        s1 = SimulateData(n_metrics=3, n_periods=5, n_users=10, seed=seed_sequence)
+        s2 = SimulateData(n_metrics=3, n_periods=5, n_users=10, seed=seed_sequence)
+        self.assertTrue(s1.data.frame_equal(s2.data))
+        self.assertEqual(seed_sequence.n_children_spawned, 0)
+
+    def test_global_random_state_untouched(self):
+        state = np.random.get_state()[1].copy()
+        SimulateData(n_metrics=3, n_periods=5, n_users=10)
+        self.assertTrue((np.random.get_state()[1] == state).all())
+
+    def test_parallel_same_data(self):
+        s1 = SimulateData(n_metrics=3, n_periods=5, n_users=10, chunk_size=3, n_workers=1)
+        s2 = SimulateData(n_metrics=3, n_periods=5, n_users=10, chunk_size=3, n_workers=2)
+        self.assertTrue(s1.data.frame_equal(s2.data))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,358 @@
+import math
+
+import numpy as np
+import polars as pl
+
 from .metrics import Metric
+from .utils.anomalies import robust_scores
+from .utils.plotter import Plotter
 
 class Tree:
+    # The Shapley decomposition grows with 2 ** the number of children
+    _max_shapley_children = 12
+    # The number of values in one block of stacked parents in the Shapley decomposition
+    _shapley_block_values = 2**20
+
     def __init__(self) -> None:
+        self.metrics = {}
         self.relationships = {}
         self.experiment_group = {}
         self.segment_group = {}
 
-    def add_relationship(self, parent_metric: Metric, child_metric: Metric):
-        pass
+    def add_relationship(self, parent_metric: Metric, child_metric: Metric, weight:float=1):
+        """Adding a parent -> child relationship to the tree. Both metrics are registered by their name.
 
-    def _join_datasets(self):
-        pass
+        The weight describes how the child drives the parent. In an additive tree the parent is the sum of weight * child,
+        i.e. a weight of -1 subtracts the child. In a multiplicative tree the parent is the product of child ** weight,
+        i.e. a weight of -1 makes the child the denominator of a ratio.
+
+        Args:
+            parent_metric (Metric): The metric which is higher up in the tree.
+            child_metric (Metric): The metric which is driving the parent metric.
+            weight (float, optional): The weight or exponent of the child. Defaults to 1.
+        """
+        for metric in [parent_metric, child_metric]:
+            self.metrics[metric.name] = metric
+        children = self.relationships.setdefault(parent_metric.name, {})
+        children[child_metric.name] = weight
+
+    def _join_datasets(self, counts:bool=False) -> pl.DataFrame:
+        """Aggregating every metric in the tree per period and joining them into one wide dataframe.
+        The aggregated frames are stacked and pivoted in one go instead of being joined one by one.
+
+        Do note that metrics compacted with period_index are indexed per metric, so they only line up with metrics which have the same periods.
+
+        Args:
+            counts (bool, optional): Whether to count the users per period instead of aggregating the values. Defaults to False.
+
+        Returns:
+            pl.DataFrame: A dataframe with a period column and one column per metric, sorted by period.
+        """
+        names = list(self.metrics)
+        if len(names) == 0:
+            raise ValueError("Please add relationships to the tree before using the metrics.")
+
+        dfs = []
+        for name, metric in self.metrics.items():
+            if counts:
+                df = metric.data.groupby("period").agg(pl.count("user_id").alias("value"))
+            else:
+                df = metric._agg_data(metric.data)
+            dfs.append(
+                df
+                .with_columns(pl.col("value").cast(pl.Float64), pl.lit(name).alias("metric"))
+                .select(["period", "metric", "value"])
+            )
+        data = (
+            pl.concat(dfs, how="vertical_relaxed") # compacted metrics can have a narrower period dtype
+            .pivot(values="value", index="period", columns="metric", aggregate_function=None)
+            .select(["period"] + names)
+            .sort(by="period")
+        )
+        return data
+
+    def _roots(self) -> list:
+        children = {child for childs in self.relationships.values() for child in childs}
+        return [name for name in self.metrics if name not in children]
+
+    def _depth_first(self) -> list:
+        """Walking the tree depth first from the roots with an explicit stack, so deep trees do not hit the recursion limit.
+        Every metric is visited once - a metric with more than one parent is visited below the first parent which reaches it.
+
+        Returns:
+            list: (name, depth, parent) tuples ordered so every child comes before its parent. The parent is None for the starting metrics.
+        """
+        order = []
+        visited = set()
+        for start in self._roots() + list(self.metrics): # the latter catches metrics only reachable through a cycle
+            if start in visited:
+                continue
+            visited.add(start)
+            stack = [(start, 0, None, iter(self.relationships.get(start, {})))]
+            while len(stack) > 0:
+                name, depth, parent, children = stack[-1]
+                child = next((c for c in children if c not in visited), None)
+                if child is None:
+                    stack.pop()
+                    order.append((name, depth, parent))
+                else:
+                    visited.add(child)
+                    stack.append((child, depth+1, name, iter(self.relationships.get(child, {}))))
+        return order
+
+    def _edges(self) -> tuple:
+        """Returning the relationships as arrays of column positions in the joined dataset.
+
+        Returns:
+            tuple: The parent positions, the child positions and the weights of all relationships.
+        """
+        index = {name: i for i, name in enumerate(self.metrics)}
+        edges = [(parent, child, weight) for parent, children in self.relationships.items() for child, weight in children.items()]
+        parents = np.array([index[parent] for parent, _, _ in edges], dtype=int)
+        children = np.array([index[child] for _, child, _ in edges], dtype=int)
+        weights = np.array([weight for _, _, weight in edges], dtype=float)
+        return parents, children, weights
+
+    def decompose_change(self, method:str="additive", parent_metric_name:str=None) -> pl.DataFrame:
+        """Decomposing the period over period change of every parent metric into the contributions of its children.
+        All relationships and all period pairs are computed at once on the matrix of aggregated values.
+
+        The methods are:
+            - additive: The parent is the sum of weight * child. The contribution is weight * the change of the child.
+            - multiplicative: The parent is the product of child ** weight, i.e. a product or a ratio. 
+                The change is split by the log change of each child (log mean Divisia).
+                The logs need strictly positive values, so the contribution is NaN in periods where the parent or a child is zero or below.
+                Use shapley for metrics which can be zero.
+            - shapley: The same model as multiplicative, but the change is split by the Shapley value of each child,
+                i.e. the average change over all orders in which the children could have changed.
+                The cost grows with 2 ** the number of children, so it is limited to parents with at most 12 children.
+                Use multiplicative for larger parents, which is also exact for products.
+            - mix_rate: The parent is the user weighted average of its children, e.g. a conversion rate per segment.
+                The contribution is split into a mix effect (the change in the share of users) and a rate effect (the change in the child).
+                The shares come from the number of users, so all relationships must have a weight of 1.
+
+        When the relationship holds exactly the contributions of the children sum to the change of the parent.
+
+        Args:
+            method (str, optional): One of additive, multiplicative, shapley and mix_rate. Defaults to "additive".
+            parent_metric_name (str, optional): Only return the decomposition of this parent. Defaults to None which returns all parents.
+
+        Returns:
+            pl.DataFrame: One row per period, parent and child with the columns period, previous_period, parent, child, parent_change and contribution.
+                The mix_rate method also has the columns mix_effect and rate_effect.
+        """
+        _valid_methods = ["additive", "multiplicative", "shapley", "mix_rate"]
+        if method not in _valid_methods:
+            raise ValueError(f"Please provide a valid decomposition method {_valid_methods}")
+
+        data = self._join_datasets()
+        names = list(self.metrics)
+        values = data.select(names).to_numpy().astype(float) # shape(n_periods, n_metrics)
+        parents, children, weights = self._edges()
+        if method == "shapley" and len(parents) > 0 and np.bincount(parents).max() > self._max_shapley_children:
+            raise ValueError(f"The shapley method supports at most {self._max_shapley_children} children per parent, please use the multiplicative method instead.")
+        if method == "mix_rate" and (weights != 1).any():
+            raise ValueError("The mix_rate method uses the number of users as weights, please add the relationships with a weight of 1.")
+
+        parent_before, parent_after = values[:-1, parents], values[1:, parents] # shape(n_periods-1, n_edges)
+        child_before, child_after = values[:-1, children], values[1:, children]
+        effects = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if method == "additive":
+                contribution = weights * (child_after - child_before)
+            elif method == "multiplicative":
+                log_mean = np.where(
+                    parent_after == parent_before, 
+                    parent_after, 
+                    (parent_after - parent_before) / (np.log(parent_after) - np.log(parent_before))
+                )
+                contribution = log_mean * weights * np.log(child_after / child_before)
+            elif method == "shapley":
+                contribution = self._shapley_contributions(child_before**weights, child_after**weights, parents)
+            else:
+                counts = self._join_datasets(counts=True).select(names).to_numpy().astype(float)
+                child_counts = counts[:, children]
+                parent_counts = np.zeros_like(counts)
+                np.add.at(parent_counts, (slice(None), parents), child_counts)
+                shares = child_counts / parent_counts[:, parents]
+                effects["mix_effect"] = (shares[1:] - shares[:-1]) * (child_before + child_after) / 2
+                effects["rate_effect"] = (shares[1:] + shares[:-1]) / 2 * (child_after - child_before)
+                contribution = effects["mix_effect"] + effects["rate_effect"]
+
+        n_pairs, n_edges = contribution.shape
+        period_index = np.repeat(np.arange(1, n_pairs+1), n_edges)
+        edge_index = np.tile(np.arange(n_edges), n_pairs)
+        df = pl.DataFrame({
+            "period": data["period"][period_index],
+            "previous_period": data["period"][period_index-1],
+            "parent": np.array(names)[parents][edge_index],
+            "child": np.array(names)[children][edge_index],
+            "parent_change": (parent_after - parent_before).ravel(),
+            "contribution": contribution.ravel(),
+            **{name: effect.ravel() for name, effect in effects.items()},
+        })
+        if parent_metric_name is not None:
+            df = df.filter(pl.col("parent")==parent_metric_name)
+        return df
+
+    def _shapley_contributions(self, before: np.ndarray, after: np.ndarray, parents: np.ndarray) -> np.ndarray:
+        """Computing the Shapley value of each child in a product of children.
+        Parents with the same number of children are stacked, so there is one vectorized computation per number of children.
+        The stacked parents and the subsets are split into blocks of about _shapley_block_values values to keep the memory bounded.
+
+        The Shapley value of child i is the weighted sum over the subsets S of the other children of v(S + i) - v(S),
+        where v(S) is the product when only the children in S have changed. Each v(S) is computed once and added with
+        a positive weight to the children in S and a negative weight to the children outside S.
+
+        Args:
+            before (np.ndarray): The factors of each relationship in the previous period. Shape(n_periods-1, n_edges).
+            after (np.ndarray): The factors of each relationship in the current period. Shape(n_periods-1, n_edges).
+            parents (np.ndarray): The parent position of each relationship.
+
+        Returns:
+            np.ndarray: The contribution of each relationship. Shape(n_periods-1, n_edges).
+        """
+        contribution = np.zeros_like(before)
+        edge_ids = np.arange(len(parents))
+        groups = {}
+        for parent in np.unique(parents):
+            edges = edge_ids[parents==parent]
+            groups.setdefault(len(edges), []).append(edges)
+
+        for k, group in groups.items():
+            # The subsets of children which have changed are the bits of the mask
+            masks = ((np.arange(2**k)[:, None] >> np.arange(k)) & 1).astype(bool) # shape(2**k, k)
+            subset_weights = np.array([math.factorial(s) * math.factorial(k-s-1) / math.factorial(k) for s in range(k)] + [0])
+            sizes = masks.sum(axis=1)
+            coefficients = np.where(masks, subset_weights[np.maximum(sizes-1, 0)][:, None], -subset_weights[sizes][:, None]) # shape(2**k, k)
+
+            group = np.array(group) # shape(n_parents, k)
+            half = k // 2
+            block_size = max(1, self._shapley_block_values // max(before.shape[0] * 2**(k-half), 1))
+            for start in range(0, len(group), block_size):
+                edges = group[start:start+block_size]
+                x0 = before[:, edges].reshape(-1, k) # shape(n_periods-1 * n_parents, k)
+                x1 = after[:, edges].reshape(-1, k)
+
+                # The products of every subset of the lower and the upper half of the children, so v(S) is one multiplication
+                products = []
+                for children in [range(half), range(half, k)]:
+                    product = np.ones((1, len(x0)))
+                    for j in children:
+                        product = np.concatenate([product * x0[:, j], product * x1[:, j]])
+                    products.append(product)
+                lower, upper = products
+
+                block = np.zeros_like(x0)
+                mask_chunk = max(1, self._shapley_block_values // len(x0))
+                for mask_start in range(0, 2**k, mask_chunk):
+                    mask_ids = np.arange(mask_start, min(mask_start+mask_chunk, 2**k))
+                    values = lower[mask_ids & (2**half - 1)] * upper[mask_ids >> half] # shape(n_masks, n_periods-1 * n_parents)
+                    block += values.T @ coefficients[mask_ids]
+                contribution[:, edges] = block.reshape(before.shape[0], len(edges), k)
+        return contribution
+
+    def detect_anomalies(self, window:int=52, threshold:float=3.5, season_length:int=1, n_seasons:int=3) -> pl.DataFrame:
+        """Flagging the periods where a metric breaks its trend for all metrics in the tree at once.
+
+        Each metric is compared to a robust baseline of its previous periods, see utils.anomalies.robust_scores.
+        A period is anomalous if the absolute score is above the threshold.
+
+        The root_cause is a hint of where the anomaly started. Going from the leaves and up the tree, 
+        an anomalous metric points to the root cause of its most anomalous child in the same period. 
+        If none of its children are anomalous, then the metric is its own root cause.
+
+        Args:
+            window (int, optional): The number of previous periods (or seasons) used for the baseline. Defaults to 52.
+            threshold (float, optional): The absolute score above which a period is anomalous. Defaults to 3.5.
+            season_length (int, optional): The number of periods in a season, e.g. 52 for yearly seasonality in weekly data. Defaults to 1.
+                The seasonal baseline needs about 2.5 seasons of history before the first period can be scored.
+            n_seasons (int, optional): The number of previous seasons used for the seasonal baseline. Defaults to 3.
+
+        Returns:
+            pl.DataFrame: One row per anomalous metric and period with the columns period, metric, value, baseline, score and root_cause.
+        """
+        data = self._join_datasets()
+        names = list(self.metrics)
+        values = data.select(names).to_numpy().astype(float) # shape(n_periods, n_metrics)
+        baseline, _, score = robust_scores(values, window=window, season_length=season_length, n_seasons=n_seasons)
+        anomalies = np.abs(score) > threshold
+
+        # Walking up the tree from the leaves, so the root cause of the children is known before the parent
+        index = {name: i for i, name in enumerate(names)}
+        magnitude = np.where(anomalies, np.abs(score), -1)
+        root_cause = np.tile(np.arange(len(names)), (values.shape[0], 1))
+        for name, _, _ in self._depth_first():
+            children = [index[child] for child in self.relationships.get(name, {})]
+            if len(children) == 0:
+                continue
+            i = index[name]
+            worst = np.array(children)[np.argmax(magnitude[:, children], axis=1)]
+            periods = np.arange(values.shape[0])
+            inherit = anomalies[:, i] & anomalies[periods, worst]
+            root_cause[:, i] = np.where(inherit, root_cause[periods, worst], i)
+
+        period_index, metric_index = np.nonzero(anomalies)
+        df = pl.DataFrame({
+            "period": data["period"][period_index],
+            "metric": np.array(names)[metric_index],
+            "value": values[period_index, metric_index],
+            "baseline": baseline[period_index, metric_index],
+            "score": score[period_index, metric_index],
+            "root_cause": np.array(names)[root_cause[period_index, metric_index]],
+        })
+        return df
+
+    def _layout(self) -> dict:
+        """Computing the position of every node in the tree.
+        The leaves are spaced evenly on the x axis and a parent is centered above its children. The y axis is the negative depth.
+        A metric which has more than one parent is only placed once - below the first parent which reaches it.
+
+        Returns:
+            dict: A dictionary of the metric name and its (x, y) position.
+        """
+        positions = {}
+        child_xs = {}
+        next_leaf = 0
+        for name, depth, parent in self._depth_first():
+            xs = child_xs.get(name, [])
+            if len(xs) == 0:
+                x = next_leaf
+                next_leaf += 1
+            else:
+                x = (min(xs) + max(xs)) / 2
+            positions[name] = (x, -depth)
+            if parent is not None:
+                child_xs.setdefault(parent, []).append(x)
+        return positions
+
+    def plot_tree(self, sparklines:bool=True):
+        """Plotting the whole metric tree in one figure.
+
+        Each node shows the latest aggregated value and the change compared to the previous period. 
+        If sparklines is True then the development over all periods is drawn above each node.
+
+        Args:
+            sparklines (bool, optional): Whether to draw the development of each metric above the node. Defaults to True.
+
+        Returns:
+            go.Figure: The plot.
+        """
+        data = self._join_datasets()
+        names = list(self.metrics)
+        values = data.select(names).to_numpy().T # shape(n_metrics, n_periods)
+
+        positions = self._layout()
+        nodes = pl.DataFrame({
+            "name": names,
+            "x": [positions[name][0] for name in names],
+            "y": [positions[name][1] for name in names],
+        })
+        edges = [(parent, child) for parent, children in self.relationships.items() for child in children]
+
+        p = Plotter()
+        fig = p.tree_plot(nodes, edges, values, sparklines=sparklines)
+        return fig
 
     def plot_development(self, parent_metric_name:str, child_metric_name:str):
         pass
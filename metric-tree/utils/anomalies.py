@@ -0,0 +1,113 @@
+import warnings
+
+import numpy as np
+
+_block_values = 2**22 # The number of values in the stacked history of one block
+
+def _nanmedian(a: np.ndarray, n: np.ndarray) -> np.ndarray:
+    """A faster np.nanmedian over the first axis. NaNs are sorted last, so the median is in the middle of the first n values.
+
+    Args:
+        a (np.ndarray): The values to take the median of.
+        n (np.ndarray): The number of non NaN values along the first axis. Must be at least 1.
+    """
+    a = np.sort(a, axis=0)
+    lower = np.take_along_axis(a, ((n-1) // 2)[None], axis=0)[0]
+    upper = np.take_along_axis(a, (n // 2)[None], axis=0)[0]
+    return (lower + upper) / 2
+
+def _history(values: np.ndarray, lags) -> np.ndarray:
+    # The lagged values of every period stacked on the first axis, shape(n_lags, n_periods, n_metrics)
+    n_periods = values.shape[0]
+    history = np.full((len(lags), ) + values.shape, np.nan)
+    for i, lag in enumerate(lags):
+        if lag < n_periods:
+            history[i, lag:] = values[:-lag]
+    return history
+
+def _robust_scores_block(values: np.ndarray, window:int, season_length:int, n_seasons:int, min_periods:int, min_scale:float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if season_length > 1:
+            # A rolling level of the previous season plus the median offset of the same period in the previous seasons
+            history = _history(values, range(1, season_length+1))
+            n = (~np.isnan(history)).sum(axis=0)
+            level = np.where(n >= max(season_length // 2, 1), _nanmedian(history, np.maximum(n, 1)), np.nan)
+            history = _history(values - level, [k*season_length for k in range(1, n_seasons+1)])
+            n = (~np.isnan(history)).sum(axis=0)
+            offset = np.where(n >= min(2, n_seasons), _nanmedian(history, np.maximum(n, 1)), np.nan)
+            baseline = level + offset
+
+            # The residuals of the previous periods, centered on their median
+            residuals = _history(values - baseline, range(1, window+1))
+            n = (~np.isnan(residuals)).sum(axis=0)
+            residuals -= _nanmedian(residuals, np.maximum(n, 1))
+            enough = (n >= min_periods) & ~np.isnan(baseline)
+        else:
+            history = _history(values, range(1, window+1))
+            n = (~np.isnan(history)).sum(axis=0)
+            baseline = _nanmedian(history, np.maximum(n, 1))
+            residuals = history - baseline
+            enough = n >= min_periods
+
+        n = np.maximum(n, 1)
+        absolute_deviation = np.abs(residuals)
+        scale = 1.4826 * _nanmedian(absolute_deviation, n)
+        scale = np.where(scale > 0, scale, 1.2533 * np.nansum(absolute_deviation, axis=0) / n)
+        scale = np.maximum(scale, min_scale * np.maximum(np.abs(baseline), 1))
+        score = (values - baseline) / scale
+    baseline[~enough] = np.nan
+    scale[~enough] = np.nan
+    score[~enough] = np.nan
+    return baseline, scale, score
+
+def robust_scores(
+        values: np.ndarray, window:int=52, season_length:int=1, n_seasons:int=3, min_periods:int=None, min_scale:float=1e-3
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Computing a robust z-score for every period and every metric at once.
+
+    The baseline of a period is the median of the previous window periods and the scale is the median absolute deviation (MAD) of those periods.
+
+    If season_length is above 1, then the baseline is a rolling level plus a seasonal offset.
+    The level is the median of the previous season_length periods. The offset is the median of value - level 
+    in the same period of the previous n_seasons seasons (at least 2 of them), i.e. the same week in the previous 3 years for weekly data with a season_length of 52.
+    The scale is the MAD of the residuals (value - baseline) of the previous window periods.
+    So the first period which can be scored is after about 2.5 seasons plus min_periods, e.g. 3 years of weekly data.
+
+    The score is (value - baseline) / (1.4826 * MAD), which is comparable to a z-score for normally distributed data.
+    The median and MAD of a short history are noisy, so short windows flag far more periods than a z-score would.
+    On normally distributed noise a window of 52 flags about 0.3% of the periods at an absolute score of 3.5, while a window of 8 flags about 5%.
+
+    If the MAD is zero, e.g. for small counts, the mean absolute deviation is used instead (times 1.2533).
+    The scale is never below min_scale * max(|baseline|, 1), so a flat history gives a large but finite score.
+
+    Args:
+        values (np.ndarray): The aggregated values with the shape (n_periods, n_metrics).
+        window (int, optional): The number of previous periods (or seasons) used for the baseline. Defaults to 52.
+        season_length (int, optional): The number of periods in a season. Defaults to 1 which means no seasonality.
+        n_seasons (int, optional): The number of previous seasons used for the seasonal offset. Defaults to 3.
+        min_periods (int, optional): The minimum number of previous values (or residuals) needed to score a period. Defaults to half the window.
+        min_scale (float, optional): The smallest scale relative to the baseline. Defaults to 1e-3.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, np.ndarray]: The baseline, the scale and the score, all with the same shape as values.
+            Periods without enough history have a NaN score, and a warning is raised if no period could be scored.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    if min_periods is None:
+        min_periods = max(window // 2, 1)
+
+    baseline, scale, score = (np.full(values.shape, np.nan) for _ in range(3))
+    # Going through blocks of metrics to keep the stacked history small
+    block_size = max(1, _block_values // max(max(window, season_length) * values.shape[0], 1))
+    for start in range(0, values.shape[1], block_size):
+        block = slice(start, start+block_size)
+        baseline[:, block], scale[:, block], score[:, block] = _robust_scores_block(values[:, block], window, season_length, n_seasons, min_periods, min_scale)
+
+    if values.size > 0 and np.isnan(score).all():
+        warnings.warn(
+            f"None of the {values.shape[0]} periods could be scored. Scoring needs at least {min_periods} previous periods"
+            + (f" after about {2.5*season_length:.0f} periods for the seasonal baseline." if season_length > 1 else ".")
+        )
+    return baseline, scale, score
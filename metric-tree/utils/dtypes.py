@@ -0,0 +1,64 @@
+import numpy as np
+import polars as pl
+
+_integer_types = [pl.UInt8, pl.Int8, pl.UInt16, pl.Int16, pl.UInt32, pl.Int32, pl.UInt64, pl.Int64]
+_numpy_integer_types = {
+    pl.UInt8: np.uint8, pl.Int8: np.int8, pl.UInt16: np.uint16, pl.Int16: np.int16,
+    pl.UInt32: np.uint32, pl.Int32: np.int32, pl.UInt64: np.uint64, pl.Int64: np.int64,
+}
+
+def _smallest_integer_type(minimum:int, maximum:int):
+    for dtype in _integer_types:
+        info = np.iinfo(_numpy_integer_types[dtype])
+        if info.min <= minimum and maximum <= info.max:
+            return dtype
+    return pl.Int64
+
+def compact_dtypes(df: pl.DataFrame, period_index:bool=False, rtol:float=1e-6) -> tuple[pl.DataFrame, dict]:
+    """Casting the columns of a user level dataframe to the smallest dtypes which can hold the data.
+
+    - Float columns are cast to Float32 if no value changes by more than rtol.
+    - Integer user_id and period columns are cast to the smallest integer type which fits the min and max value.
+        Other integer columns, e.g. value, are kept as they are so sums of them cannot overflow.
+    - A datetime period column is cast to Date if all periods are at midnight.
+        If period_index is True it is replaced by the index of the period instead, i.e. 0 for the first period, 1 for the second etc.
+    - String columns other than user_id and period, e.g. variant or segment labels, are cast to Categorical.
+
+    Do note that the period index is computed per dataframe, so it is only comparable between dataframes which contain the same periods.
+    Also note that Float32 only holds about 7 significant digits. The check is per value, so aggregate Float32 columns as Float64 
+    to avoid the rounding adding up, which is what Metric does.
+
+    Args:
+        df (pl.DataFrame): The dataframe which should be compacted.
+        period_index (bool, optional): Whether to replace the period column with an integer index. Defaults to False.
+        rtol (float, optional): The largest relative change allowed when casting floats to Float32. Defaults to 1e-6.
+
+    Returns:
+        tuple[pl.DataFrame, dict]: The compacted dataframe and a memory report which looks like this:
+            {
+                "before": 1000, # bytes
+                "after": 500, # bytes
+            }
+    """
+    before = df.estimated_size()
+    casts = []
+    for col, dtype in df.schema.items():
+        series = df[col]
+        if col == "period" and period_index:
+            index = series.rank(method="dense").cast(pl.Int64) - 1
+            casts.append(index.cast(_smallest_integer_type(0, index.max() or 0)))
+        elif col == "period" and dtype == pl.Datetime:
+            if (series.dt.truncate("1d") == series).all():
+                casts.append(series.cast(pl.Date))
+        elif dtype == pl.Float64:
+            compact = series.cast(pl.Float32)
+            change = (compact.cast(pl.Float64) - series).abs()
+            if ((change <= rtol*series.abs()) | change.is_nan()).fill_null(True).all():
+                casts.append(compact)
+        elif col in ["user_id", "period"] and dtype in _integer_types and series.null_count() < len(series):
+            casts.append(series.cast(_smallest_integer_type(series.min(), series.max())))
+        elif dtype == pl.Utf8 and col not in ["user_id", "period"]:
+            casts.append(series.cast(pl.Categorical))
+
+    df = df.with_columns(casts)
+    return df, {"before": before, "after": df.estimated_size()}
@@ -2,6 +2,7 @@ import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import plotly.express as px
 
+import numpy as np
 import polars as pl
 import pandas as pd
 
@@ -215,7 +216,116 @@ class Plotter:
         )
 
         return fig
-    
+
+    def tree_plot(
+            self, nodes: pd.DataFrame | pl.DataFrame, edges: list, values: np.ndarray, sparklines: bool=True, 
+            px_per_leaf:int=120, px_per_level:int=120
+        ) -> go.Figure:
+        """This function creates a plot of a whole metric tree in one figure.
+
+        The plot is built from a few batched traces - one for the edges, one for the sparklines and one for the nodes -
+        so the time it takes to draw does not depend on the number of figures but only on the number of points.
+
+        Each node is labelled with its latest value and the change compared to the previous period.
+        The node is colored with the divergent colors depending on whether the metric went up or down.
+
+        The size of the figure grows with the layout, so each leaf gets px_per_leaf pixels of width and each level gets px_per_level pixels of height.
+        It is never smaller than the template.
+
+        Args:
+            nodes (pd.DataFrame | pl.DataFrame): The nodes with the columns name, x and y which is the precomputed layout.
+            edges (list): A list of (parent name, child name) tuples.
+            values (np.ndarray): The aggregated values with the shape (n_nodes, n_periods) in the same order as the nodes.
+            sparklines (bool, optional): Whether to draw the development of each metric above the node. Defaults to True.
+            px_per_leaf (int, optional): The width in pixels per unit on the x axis of the layout. Defaults to 120.
+            px_per_level (int, optional): The height in pixels per level of the tree. Defaults to 120.
+
+        Returns:
+            go.Figure: The plot.
+        """
+        names = list(nodes["name"])
+        x = np.asarray(nodes["x"], dtype=float)
+        y = np.asarray(nodes["y"], dtype=float)
+        values = np.asarray(values, dtype=float).reshape(len(names), -1)
+        index = {name: i for i, name in enumerate(names)}
+
+        # Edges as one line trace, separated by gaps
+        parents = np.array([index[parent] for parent, _ in edges], dtype=int)
+        children = np.array([index[child] for _, child in edges], dtype=int)
+        edge_x = np.column_stack([x[parents], x[children], np.full(len(edges), np.nan)]).ravel()
+        edge_y = np.column_stack([y[parents], y[children], np.full(len(edges), np.nan)]).ravel()
+        fig = go.Figure()
+        fig.add_trace(
+            go.Scatter(
+                x=edge_x, y=edge_y,
+                mode="lines",
+                line=dict(color=self.secondary_colors["light_grey"], width=1),
+                hoverinfo="skip",
+                showlegend=False
+            )
+        )
+
+        # Sparklines as one line trace, each scaled into a box above its node
+        n_periods = values.shape[1]
+        if sparklines and n_periods > 1:
+            with np.errstate(invalid="ignore"):
+                lower = np.nanmin(values, axis=1, keepdims=True)
+                spread = np.nanmax(values, axis=1, keepdims=True) - lower
+            spread[~(spread > 0)] = 1
+            scaled = (values - lower) / spread
+            offsets = np.linspace(-0.35, 0.35, n_periods)
+            spark_x = np.column_stack([x[:, None] + offsets, np.full(len(names), np.nan)]).ravel()
+            spark_y = np.column_stack([y[:, None] + 0.1 + 0.25*scaled, np.full(len(names), np.nan)]).ravel()
+            fig.add_trace(
+                go.Scatter(
+                    x=spark_x, y=spark_y,
+                    mode="lines",
+                    line=dict(color=self.primary_colors["blue"], width=1),
+                    hoverinfo="skip",
+                    showlegend=False
+                )
+            )
+
+        # Nodes as one marker trace with the latest value and the change
+        latest = values[:, -1]
+        if n_periods > 1:
+            previous = values[:, -2]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                change = np.where(previous != 0, latest/previous - 1, np.nan)
+        else:
+            change = np.full(len(names), np.nan)
+        node_colors = np.where(
+            change > 0, self.divergent_colors["good"],
+            np.where(change < 0, self.divergent_colors["bad"], self.divergent_colors["mid"])
+        )
+        text = [
+            f"{name}<br>{value:,.1f}" + ("" if np.isnan(c) else f" ({c:+.1%})")
+            for name, value, c in zip(names, latest, change)
+        ]
+        fig.add_trace(
+            go.Scatter(
+                x=x, y=y, text=text,
+                mode="markers+text",
+                marker=dict(color=node_colors, size=12),
+                textposition="bottom center",
+                hoverinfo="text",
+                showlegend=False
+            )
+        )
+
+        # Adjusting layout, growing the figure with the number of leaves and levels
+        margin = self.layout_template["layout"].margin
+        n_leaves = np.ptp(x) + 1 if len(x) > 0 else 1
+        n_levels = np.ptp(y) + 1 if len(y) > 0 else 1
+        fig.update_layout(
+            template=self.layout_template,
+            xaxis=dict(visible=False),
+            yaxis=dict(visible=False, rangemode="normal"),
+            width=max(self.layout_template["layout"].width, int(n_leaves*px_per_leaf) + margin.l + margin.r),
+            height=max(self.layout_template["layout"].height, int(n_levels*px_per_level) + margin.t + margin.b),
+        )
+        return fig
+
 if __name__ == "__main__":
 
     df = pl.DataFrame(data={
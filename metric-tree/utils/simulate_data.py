@@ -1,11 +1,26 @@
 import numpy as np
 import polars as pl
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 
-np.random.seed(42) # Ensuring similar datasets
+from .dtypes import compact_dtypes
+
+def _simulate_chunk(seed_sequence: np.random.SeedSequence, metric_means: np.ndarray, metric_cov: np.ndarray, n_users:int, n_periods:int) -> np.ndarray:
+    """Simulating the metrics of a chunk of users with its own random stream. 
+    This is a module level function so it can be sent to other processes.
+
+    Returns:
+        np.ndarray: The metrics with the shape (n_users, n_periods, n_metrics).
+    """
+    rng = np.random.default_rng(seed_sequence)
+    return rng.multivariate_normal(metric_means, metric_cov, (n_users, n_periods))
 
 class SimulateData:
-    def __init__(self, n_metrics:int, n_periods:int, n_users:int) -> None:
+    def __init__(
+            self, n_metrics:int, n_periods:int, n_users:int, compact:bool=False, 
+            seed:int | np.random.SeedSequence | np.random.Generator | None=42, chunk_size:int=10_000, n_workers:int=1,
+            period_index:bool=False
+        ) -> None:
         """This class can be used to generate a fictive dataset which can be used to showcase and test the rest of the packages.
         The main function is the _create_dataset() which creates a dataset that contains n_metrics, n_users over n_periods.
 
@@ -15,13 +30,37 @@ class SimulateData:
             n_metrics (int): The number of metrics which should be included in the data.
             n_periods (int): The number of periods which should be included. This will be the number of weeks up to today.
             n_users (int): The number of users in the data.
+            compact (bool, optional): Whether to cast the data to the smallest dtypes which can hold it. 
+                The memory before and after is stored in memory_report. Defaults to False.
+            seed (int | np.random.SeedSequence | np.random.Generator | None, optional): The seed of the random numbers. 
+                The same seed gives the same dataset. None gives a new dataset every time. Defaults to 42.
+            chunk_size (int, optional): The number of users simulated with each random stream. Defaults to 10_000.
+            n_workers (int, optional): The number of processes used to simulate the chunks. 
+                The dataset does not depend on the number of workers, only on the seed and the chunk_size. Defaults to 1.
+            period_index (bool, optional): Whether compacting replaces the period with its index, i.e. 0 for the first week. 
+                The dates are kept in periods. Defaults to False.
         """
         self.n_metrics = n_metrics
         self.n_periods = n_periods
         self.n_users = n_users
+        self.chunk_size = chunk_size
+        self.n_workers = n_workers
+        if isinstance(seed, np.random.Generator):
+            seed = np.random.SeedSequence(seed.integers(2**63))
+        elif isinstance(seed, np.random.SeedSequence):
+            # Spawning from a copy, as spawning changes the seed sequence of the caller
+            seed = np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size)
+        else:
+            seed = np.random.SeedSequence(seed)
+        # Separate streams for the shared parameters, the user chunks and the experiments
+        self._parameter_seed, self._chunk_seed, experiment_seed = seed.spawn(3)
+        self.rng = np.random.default_rng(experiment_seed)
         self.experiment_groups = {}
         self.segments = {}
+        self.memory_report = None
         self._create_dataset()
+        if compact:
+            self.data, self.memory_report = compact_dtypes(self.data, period_index=period_index)
 
     def _create_dataset(self) -> pl.DataFrame:
         """This function will create a dataset which looks like the below:
@@ -51,19 +90,31 @@ class SimulateData:
         """
 
         # Creating the base data with some covariance
-        metric_means = np.random.uniform(10, 100, size=self.n_metrics)
-        metric_cov_base = np.random.rand(self.n_metrics, self.n_metrics)
+        rng = np.random.default_rng(self._parameter_seed)
+        metric_means = rng.uniform(10, 100, size=self.n_metrics)
+        metric_cov_base = rng.random((self.n_metrics, self.n_metrics))
         metric_cov = np.dot(metric_cov_base, metric_cov_base.transpose())
-        data = np.random.multivariate_normal(metric_means, metric_cov, (self.n_users, self.n_periods)) # shape(n_users, n_periods, n_metrics)
+
+        # Each chunk of users has its own random stream, so the data is the same no matter how many workers are used
+        chunk_users = [min(self.chunk_size, self.n_users - start) for start in range(0, self.n_users, self.chunk_size)]
+        chunk_seeds = self._chunk_seed.spawn(len(chunk_users))
+        args = (chunk_seeds, [metric_means]*len(chunk_users), [metric_cov]*len(chunk_users), chunk_users, [self.n_periods]*len(chunk_users))
+        if self.n_workers > 1 and len(chunk_users) > 1:
+            with ProcessPoolExecutor(max_workers=self.n_workers) as executor:
+                chunks = list(executor.map(_simulate_chunk, *args))
+        else:
+            chunks = list(map(_simulate_chunk, *args))
+        data = np.concatenate(chunks, axis=0) # shape(n_users, n_periods, n_metrics)
 
         # List of user ids and periods
         user_ids = np.linspace(1, self.n_users, self.n_users).astype(int)
         periods = np.arange(datetime(1985,7,1), datetime.now(), timedelta(weeks=1)).astype(datetime)
         periods = periods[len(periods)-self.n_periods:]
+        self.periods = list(periods)
 
         # Creating the trend
         first_timestamp = min(periods).timestamp()
-        period_trend = np.array([p.timestamp()/first_timestamp for p in periods]) * np.random.normal(0.005, 0.01, size=self.n_periods) + 1 # increase over time
+        period_trend = np.array([p.timestamp()/first_timestamp for p in periods]) * rng.normal(0.005, 0.01, size=self.n_periods) + 1 # increase over time
         period_trend = np.cumprod(period_trend) # Doing a cumulative sum to ensure trend
 
         # Multiplying the trend to the existing data
@@ -80,7 +131,7 @@ class SimulateData:
                 df
                 .with_columns(
                     pl.Series(name="user_id", values=user_ids),
-                    pl.Series(name="period", values=[period]*self.n_users),
+                    pl.lit(period).alias("period"),
                 )
             )
             dfs.append(df)
@@ -101,6 +152,10 @@ class SimulateData:
                     "variant2": etc.
                 } 
         """
+        if self.data.schema["period"] not in [pl.Date, pl.Datetime]:
+            # The period is an index, so the start date is the index of the first period on or after it
+            experiment_start_date = sum(period < experiment_start_date for period in self.periods)
+
         variant_users = []
         for group, users in experiment_groups.items():
             if group.lower() != "control":
@@ -118,7 +173,7 @@ class SimulateData:
         for group, users in experiment_groups.items():
             if group.lower() != "control":
                 sub_df = variant_df.filter(pl.col("user_id").is_in(users))
-                changes = np.random.normal(1.03, 0.03, size=self.n_metrics)
+                changes = self.rng.normal(1.03, 0.03, size=self.n_metrics)
                 for col, change in zip(metric_cols, changes):
                     sub_df = sub_df.with_columns(pl.col(col)*change)
                 variant_dfs.append(sub_df)